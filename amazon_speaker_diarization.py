@@ -1,15 +1,291 @@
+import asyncio
+import atexit
 import boto3
+import concurrent.futures
+import functools
 import json
+import logging
+import threading
 import time
 import uuid
 import os
+import urllib3
+from collections import defaultdict
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from transcription_cache import make_cache_key, load_cached_result, save_cached_result
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
-def transcribe_with_speaker_diarization(audio_file_uri, language_code='ja-JP', max_speakers=10):
+logger = logging.getLogger(__name__)
+
+# ジョブ状態の確認間隔（秒）。短いジョブはすぐに検知し、長いジョブでは間隔を広げる
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 30.0
+POLL_BACKOFF_FACTOR = 1.6
+
+# 処理中の進捗を表示する間隔（秒）
+PROGRESS_REPORT_INTERVAL = 60
+
+# 複数ファイルを処理する際の同時実行ジョブ数の上限
+DEFAULT_MAX_CONCURRENCY = 5
+
+# 単語の間に空白を入れない言語（言語コードの先頭部分）
+NO_SPACE_LANGUAGE_PREFIXES = ('ja', 'zh')
+
+# 結果JSONの results 配下で話者分離に使用するキー
+TRANSCRIPT_RESULT_KEYS = ('speaker_labels', 'items')
+
+# 結果JSONのダウンロード設定
+TRANSCRIPT_DOWNLOAD_TIMEOUT = 60  # 秒
+
+# 結果JSONのダウンロードに使用するHTTPコネクションプール
+# 複数ジョブの結果を取得する際にTCP/TLS接続を再利用する
+http_pool = urllib3.PoolManager(maxsize=DEFAULT_MAX_CONCURRENCY)
+
+# クライアント作成時の排他制御用ロック
+client_lock = threading.Lock()
+
+# 完了したジョブの削除など、呼び出し元を待たせる必要のない後片付けを実行するスレッドプール
+# プロセス終了時には、実行中の後片付けが終わるまで待機する
+cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix='cleanup')
+atexit.register(cleanup_executor.shutdown, wait=True)
+
+def load_transcript_results(stream):
+    """
+    Amazon Transcribeの結果JSONから、話者分離に必要な部分だけを読み込む関数
+    
+    ijsonがインストールされている場合は、ストリームを逐次解析して
+    results.speaker_labels と results.items のみを保持する（全文テキストなどは読み捨てる）。
+    インストールされていない場合は、JSON全体を読み込む（orjsonがあればorjsonで解析する）
+    
+    Parameters:
+        stream: 結果JSONを読み出せるバイナリストリーム（HTTPレスポンスなど）
+    
+    Returns:
+        dict: 'speaker_labels'（存在する場合）と 'items' を含む辞書
+    """
+    if ijson is None:
+        # orjsonはbytesを直接解析できるため、デコードせずに渡す
+        if orjson is not None:
+            return orjson.loads(stream.read())['results']
+        return json.load(stream)['results']
+    
+    results = {}
+    for key, value in ijson.kvitems(stream, 'results'):
+        if key in TRANSCRIPT_RESULT_KEYS:
+            results[key] = value
+    return results
+
+
+def download_transcript_results(transcript_uri):
+    """
+    Amazon Transcribeの結果JSONをダウンロードし、話者分離に必要な部分を読み込む関数
+    
+    gzip圧縮での転送を要求し、レスポンスは展開しながら逐次解析する
+    
+    Parameters:
+        transcript_uri (str): 結果JSONのURI（TranscriptFileUri）
+    
+    Returns:
+        dict: 'speaker_labels'（存在する場合）と 'items' を含む辞書
+    """
+    response = http_pool.request(
+        'GET',
+        transcript_uri,
+        headers={'Accept-Encoding': 'gzip, deflate'},
+        timeout=TRANSCRIPT_DOWNLOAD_TIMEOUT,
+        preload_content=False,
+    )
+    try:
+        if response.status != 200:
+            raise Exception(f"文字起こし結果のダウンロードに失敗しました: HTTP {response.status}")
+        return load_transcript_results(response)
+    finally:
+        response.release_conn()
+
+
+@functools.lru_cache(maxsize=None)
+def get_transcribe_client(region_name=None):
+    """
+    Amazon Transcribeクライアントを取得する関数
+    
+    クライアントの作成には認証情報の解決などで時間がかかるため、一度作成したものを再利用する
+    
+    Parameters:
+        region_name (str): リージョン名（Noneの場合は環境変数などから取得）
+    
+    Returns:
+        Amazon Transcribeクライアント
+    """
+    # boto3のデフォルトセッションからのクライアント作成はスレッドセーフではないため、ロックする
+    with client_lock:
+        return boto3.client('transcribe', region_name=region_name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client(region_name=None):
+    """
+    S3クライアントを取得する関数（一度作成したものを再利用する）
+    
+    Parameters:
+        region_name (str): リージョン名（Noneの場合は環境変数などから取得）
+    
+    Returns:
+        S3クライアント
+    """
+    with client_lock:
+        return boto3.client('s3', region_name=region_name)
+
+
+def get_word_separator(language_code):
+    """
+    言語コードに応じた単語の区切り文字を返す関数
+    
+    日本語や中国語は単語の間に空白を入れないため、空文字で連結する
+    
+    Parameters:
+        language_code (str): 言語コード（'ja-JP'など）
+    
+    Returns:
+        str: 単語の区切り文字
+    """
+    return '' if language_code.lower().startswith(NO_SPACE_LANGUAGE_PREFIXES) else ' '
+
+
+def group_words_by_speaker(speaker_segments, items, separator=' '):
+    """
+    話者セグメントと単語アイテムを対応付け、話者ごとの発言にまとめる関数
+    
+    セグメントと単語はどちらも時刻順に並べてから1回の走査で対応付けるため、
+    処理量はセグメント数と単語数の和に比例する
+    
+    Parameters:
+        speaker_segments (list): Amazon Transcribeの results.speaker_labels.segments
+        items (list): Amazon Transcribeの results.items
+        separator (str): 単語の区切り文字（get_word_separatorで取得）
+    
+    Returns:
+        dict: 話者ラベルをキー、発言内容を値とする辞書
+    """
+    # 単語（発音）アイテムのみを対象に、時刻を一度だけ数値に変換
+    words = sorted(
+        (
+            (float(item['start_time']), float(item['end_time']), item['alternatives'][0]['content'])
+            for item in items
+            if 'start_time' in item and item.get('alternatives')
+        ),
+        key=lambda word: word[0],
+    )
+    segments = sorted(
+        (
+            (float(segment['start_time']), float(segment['end_time']), segment['speaker_label'])
+            for segment in speaker_segments
+        ),
+        key=lambda segment: segment[0],
+    )
+    
+    # 話者ごとの単語を1つのリストに集め、最後に1回だけ連結する
+    # （セグメントごとの中間文字列は作らない）
+    speaker_words = defaultdict(list)
+    word_count = len(words)
+    j = 0
+    
+    # 各セグメント内の話者と発言内容を対応付け
+    for start_time, end_time, speaker_label in segments:
+        # 発言がなくても話者としては登録する
+        words_of_speaker = speaker_words[speaker_label]
+        
+        # セグメント開始より前の単語を読み飛ばす
+        while j < word_count and words[j][0] < start_time:
+            j += 1
+        
+        # セグメントの時間範囲内にある単語を追加
+        k = j
+        while k < word_count and words[k][0] <= end_time:
+            if words[k][1] <= end_time:
+                words_of_speaker.append(words[k][2])
+            k += 1
+    
+    # 話者ごとの発言をまとめる
+    return {speaker: separator.join(spoken) for speaker, spoken in speaker_words.items()}
+
+
+def delete_transcription_job(transcribe, job_name):
+    """
+    完了した文字起こしジョブを削除する関数（cleanup_executorからバックグラウンドで実行される）
+    
+    Parameters:
+        transcribe: Amazon Transcribeクライアント
+        job_name (str): 削除するジョブ名
+    """
+    try:
+        transcribe.delete_transcription_job(TranscriptionJobName=job_name)
+    except Exception as e:
+        print(f"ジョブの削除中にエラーが発生しました: {e}")
+
+
+def upload_audio_to_s3(local_file_path, bucket_name, file_name):
+    """
+    音声ファイルをS3にアップロードする関数
+    
+    upload_fileは既定の設定で、8MBを超えるファイルを複数のパートに分けて並列にアップロードする
+    
+    Parameters:
+        local_file_path (str): アップロードする音声ファイルのパス
+        bucket_name (str): アップロード先のS3バケット名
+        file_name (str): S3上のファイル名（オブジェクトキー）
+    
+    Returns:
+        str: アップロードしたファイルのS3 URI (s3://bucket-name/file-name.mp3)
+    """
+    s3 = get_s3_client()
+    s3.upload_file(local_file_path, bucket_name, file_name)
+    return f"s3://{bucket_name}/{file_name}"
+
+
+def get_cache_key(audio_file_uri, language_code, max_speakers):
+    """
+    S3上のオーディオファイルと文字起こし設定からキャッシュキーを生成する関数
+    
+    オブジェクトの内容はS3のETagで識別する（ファイルを再ダウンロードせずに済む）
+    
+    Parameters:
+        audio_file_uri (str): S3上のオーディオファイルURI (s3://bucket-name/file-name.mp3)
+        language_code (str): 言語コード
+        max_speakers (int): 想定される最大話者数
+    
+    Returns:
+        str: キャッシュキー（ETagを取得できない場合はNone）
+    """
+    parsed_url = urlparse(audio_file_uri)
+    try:
+        s3 = get_s3_client()
+        head = s3.head_object(Bucket=parsed_url.netloc, Key=parsed_url.path.lstrip('/'))
+    except Exception as e:
+        print(f"S3オブジェクト情報の取得に失敗したため、キャッシュを使用しません: {e}")
+        return None
+    
+    return make_cache_key(f"{audio_file_uri}#{head['ETag']}", {
+        'service': 'amazon',
+        'language_code': language_code,
+        'max_speakers': max_speakers,
+        'word_separator': get_word_separator(language_code),
+    })
+
+
+def transcribe_with_speaker_diarization(audio_file_uri, language_code='ja-JP', max_speakers=10, timeout=None,
+                                        use_cache=True):
     """
     Amazon Transcribeを使用して、オーディオファイルの文字起こしと話者分離を行う関数
     
@@ -17,12 +293,22 @@ def transcribe_with_speaker_diarization(audio_file_uri, language_code='ja-JP', m
         audio_file_uri (str): S3上のオーディオファイルURI (s3://bucket-name/file-name.mp3)
         language_code (str): 言語コード（日本語の場合は'ja-JP'）
         max_speakers (int): 想定される最大話者数
+        timeout (int): ジョブ完了待機のタイムアウト時間（秒）。Noneの場合は完了するまで待機する
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
     
     Returns:
         dict: 話者ごとに分けられた文字起こし結果
     """
-    # Amazon Transcribeクライアントの初期化
-    transcribe = boto3.client('transcribe')
+    # キャッシュの確認
+    cache_key = get_cache_key(audio_file_uri, language_code, max_speakers) if use_cache else None
+    if cache_key is not None:
+        cached = load_cached_result(cache_key)
+        if cached is not None:
+            print(f"キャッシュから結果を読み込みました: {audio_file_uri}")
+            return cached
+    
+    # Amazon Transcribeクライアントの取得（プロセス内で再利用する）
+    transcribe = get_transcribe_client()
     
     # ジョブ名の生成（一意の名前である必要がある）
     job_name = f"speaker-diarization-{str(uuid.uuid4())}"
@@ -50,13 +336,39 @@ def transcribe_with_speaker_diarization(audio_file_uri, language_code='ja-JP', m
         }
     )
     
-    # ジョブの完了を待機
+    # ジョブの完了を待機（指数バックオフで確認間隔を広げる）
+    if timeout is None:
+        print("処理中... タイムアウト: なし")
+    else:
+        print(f"処理中... タイムアウト: {timeout}秒")
+    start_time = time.monotonic()
+    deadline = start_time + timeout if timeout is not None else float('inf')
+    delay = POLL_INITIAL_DELAY
+    next_report_time = PROGRESS_REPORT_INTERVAL
     while True:
         status = transcribe.get_transcription_job(TranscriptionJobName=job_name)
         if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
             break
-        print("処理中...")
-        time.sleep(30)
+        
+        now = time.monotonic()
+        if now >= deadline:
+            # 待機を打ち切ったジョブが残らないよう、削除してから例外を送出する
+            cleanup_executor.submit(delete_transcription_job, transcribe, job_name)
+            raise TimeoutError(f"処理がタイムアウトしました（{timeout}秒）。ジョブ {job_name} を削除します。"
+                               f"より長いタイムアウト時間を指定してください。")
+        
+        # 確認のたびに表示すると出力が多くなるため、一定間隔ごとに表示する
+        elapsed_time = now - start_time
+        logger.debug("ジョブ %s の状態: %s（経過時間: %.1f秒）", job_name,
+                     status['TranscriptionJob']['TranscriptionJobStatus'], elapsed_time)
+        if elapsed_time >= next_report_time:
+            print(f"処理中... 経過時間: {int(elapsed_time)}秒")
+            next_report_time += PROGRESS_REPORT_INTERVAL
+        
+        time.sleep(min(delay, deadline - now))
+        delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
+    
+    print(f"処理が完了しました。所要時間: {int(time.monotonic() - start_time)}秒")
     
     # ジョブが失敗した場合
     if status['TranscriptionJob']['TranscriptionJobStatus'] == 'FAILED':
@@ -66,58 +378,92 @@ def transcribe_with_speaker_diarization(audio_file_uri, language_code='ja-JP', m
     transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
     
     # 結果のダウンロードと解析
-    import urllib.request
-    response = urllib.request.urlopen(transcript_uri)
-    data = json.loads(response.read().decode('utf-8'))
+    results = download_transcript_results(transcript_uri)
+    
+    # 完了したジョブの削除（オプション）。結果の解析と並行してバックグラウンドで行う
+    cleanup_executor.submit(delete_transcription_job, transcribe, job_name)
     
     # 話者ごとの発言を整理
     speaker_transcripts = {}
     
-    if 'speaker_labels' in data['results']:
-        speaker_segments = data['results']['speaker_labels']['segments']
-        items = data['results']['items']
-        
-        # 各セグメント内の話者と発言内容を対応付け
-        for segment in speaker_segments:
-            speaker_label = segment['speaker_label']
-            start_time = float(segment['start_time'])
-            end_time = float(segment['end_time'])
-            
-            if speaker_label not in speaker_transcripts:
-                speaker_transcripts[speaker_label] = []
-            
-            # セグメント内の単語を特定
-            segment_words = []
-            for item in items:
-                # 単語（発音）アイテムのみを対象
-                if 'start_time' not in item:
-                    continue
-                
-                item_start_time = float(item['start_time'])
-                item_end_time = float(item['end_time'])
-                
-                # セグメントの時間範囲内にある単語を追加
-                if item_start_time >= start_time and item_end_time <= end_time:
-                    if 'alternatives' in item and len(item['alternatives']) > 0:
-                        segment_words.append(item['alternatives'][0]['content'])
-            
-            # セグメント内の単語を連結して追加
-            if segment_words:
-                speaker_transcripts[speaker_label].append(' '.join(segment_words))
-    
-    # 話者ごとの発言をまとめる
-    for speaker, segments in speaker_transcripts.items():
-        speaker_transcripts[speaker] = ' '.join(segments)
+    if 'speaker_labels' in results:
+        speaker_transcripts = group_words_by_speaker(
+            results['speaker_labels']['segments'],
+            results['items'],
+            separator=get_word_separator(language_code),
+        )
     
-    # 完了したジョブの削除（オプション）
-    try:
-        transcribe.delete_transcription_job(TranscriptionJobName=job_name)
-    except Exception as e:
-        print(f"ジョブの削除中にエラーが発生しました: {e}")
+    if cache_key is not None and speaker_transcripts:
+        save_cached_result(cache_key, speaker_transcripts)
     
     return speaker_transcripts
 
 
+async def transcribe_many_async(audio_file_uris, language_code='ja-JP', max_speakers=10, timeout=None,
+                                max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=True):
+    """
+    複数のオーディオファイルの文字起こしと話者分離を並行して行う関数（非同期版）
+    
+    各ジョブはスレッドプール上で実行されるため、イベントループはブロックされない
+    
+    Parameters:
+        audio_file_uris (list): S3上のオーディオファイルURIのリスト
+        language_code (str): 言語コード（日本語の場合は'ja-JP'）
+        max_speakers (int): 想定される最大話者数
+        timeout (int): 各ジョブの完了待機のタイムアウト時間（秒）。Noneの場合は完了するまで待機する
+        max_concurrency (int): 同時に実行するジョブ数の上限
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
+    
+    Returns:
+        list: 入力と同じ順序で並んだ、ファイルごとの文字起こし結果（dict）。処理に失敗したファイルの位置には発生した例外が入る
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(audio_file_uri):
+        async with semaphore:
+            return await loop.run_in_executor(
+                None,
+                functools.partial(
+                    transcribe_with_speaker_diarization,
+                    audio_file_uri,
+                    language_code=language_code,
+                    max_speakers=max_speakers,
+                    timeout=timeout,
+                    use_cache=use_cache,
+                ),
+            )
+    
+    # 一部のファイルが失敗しても、他のファイルの結果は返す
+    return await asyncio.gather(*[run(uri) for uri in audio_file_uris], return_exceptions=True)
+
+
+def transcribe_many(audio_file_uris, language_code='ja-JP', max_speakers=10, timeout=None,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=True):
+    """
+    複数のオーディオファイルの文字起こしと話者分離を並行して行う関数
+    
+    Parameters:
+        audio_file_uris (list): S3上のオーディオファイルURIのリスト
+        language_code (str): 言語コード（日本語の場合は'ja-JP'）
+        max_speakers (int): 想定される最大話者数
+        timeout (int): 各ジョブの完了待機のタイムアウト時間（秒）。Noneの場合は完了するまで待機する
+        max_concurrency (int): 同時に実行するジョブ数の上限
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
+    
+    Returns:
+        list: 入力と同じ順序で並んだ、ファイルごとの文字起こし結果（dict）。処理に失敗したファイルの位置には発生した例外が入る
+    """
+    return asyncio.run(transcribe_many_async(
+        audio_file_uris,
+        language_code=language_code,
+        max_speakers=max_speakers,
+        timeout=timeout,
+        max_concurrency=max_concurrency,
+        use_cache=use_cache,
+    ))
+
+
 def main():
     # 使用例（事前にS3にファイルをアップロードする必要があります）
     audio_file_uri = "s3://your-bucket-name/your-audio-file.mp3"
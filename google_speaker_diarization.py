@@ -1,11 +1,160 @@
+import asyncio
+import atexit
+import concurrent.futures
+import functools
+import logging
+import operator
 import os
+import pathlib
+import re
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
 from google.cloud import speech_v1p1beta1 as speech
 from dotenv import load_dotenv
 from google.cloud import storage
+try:
+    from google.cloud.storage import transfer_manager
+except ImportError:  # google-cloud-storage 2.7未満
+    transfer_manager = None
+# upload_chunks_concurrently と THREAD は transfer_manager より後（2.10）で追加されたため、個別に確認する
+if transfer_manager is not None and not (
+    hasattr(transfer_manager, 'upload_chunks_concurrently') and hasattr(transfer_manager, 'THREAD')
+):
+    transfer_manager = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from transcription_cache import file_digest, make_cache_key, load_cached_result, save_cached_result
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 複数ファイルを処理する際の同時実行数の上限
+DEFAULT_MAX_CONCURRENCY = 5
+
+# 長い音声をチャンクに分割して並行処理する際の設定
+DEFAULT_CHUNK_SEC = 300  # チャンクの長さ（秒）
+DEFAULT_OVERLAP_SEC = 5  # 隣り合うチャンクの重なり（秒）
+CHUNK_SAMPLE_RATE = 16000  # チャンクのサンプルレート（Hz）
+
+# ファイル名やパスから日本語音声と判定するキーワード（1回の走査で判定できるよう正規表現にまとめる）
+JAPANESE_KEYWORDS = ['japan', 'japanese', 'jp', 'ja', '日本', '日本語']
+JAPANESE_KEYWORDS_PATTERN = re.compile('|'.join(map(re.escape, JAPANESE_KEYWORDS)), re.IGNORECASE)
+
+# 処理中の進捗を表示する間隔（秒）
+PROGRESS_REPORT_INTERVAL = 60
+
+# 標準的なWAVファイルのヘッダーサイズ（バイト）
+WAV_HEADER_SIZE = 44
+
+# ストリーミング認識で1回に送信する音声データのサイズ
+STREAMING_FRAME_SIZE = 25 * 1024  # 25KB
+
+# GCSへの並列アップロードの設定
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+UPLOAD_MAX_WORKERS = 8
+
+# クライアント作成時の排他制御用ロック（並行処理中の初回呼び出しが重ならないようにする）
+client_lock = threading.Lock()
+
+# 処理後のGCSファイル削除など、呼び出し元を待たせる必要のない後片付けを実行するスレッドプール
+# プロセス終了時には、実行中の後片付けが終わるまで待機する
+cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="cleanup")
+atexit.register(cleanup_executor.shutdown, wait=True)
+
+@functools.lru_cache(maxsize=None)
+def get_speech_client():
+    """
+    Speech-to-Text APIクライアントを取得する関数
+    
+    クライアントの作成には認証情報の解決などで時間がかかるため、一度作成したものを再利用する
+    （gRPCのチャネルも再利用される）
+    
+    Returns:
+        speech.SpeechClient: Speech-to-Text APIクライアント
+    """
+    with client_lock:
+        return speech.SpeechClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage_client():
+    """
+    Cloud Storageクライアントを取得する関数（一度作成したものを再利用する）
+    
+    Returns:
+        storage.Client: Cloud Storageクライアント
+    """
+    with client_lock:
+        return storage.Client()
+
+
+def read_wav_sample_rate(audio_file_path):
+    """
+    WAVファイルの先頭44バイトからサンプルレートを直接読み取る関数
+    
+    RIFFヘッダーの直後にfmtチャンクがある標準的なWAVファイルのみを対象とし、
+    それ以外の構造の場合はNoneを返す
+    
+    Parameters:
+        audio_file_path (str): WAVファイルのパス
+        
+    Returns:
+        int: サンプルレート（Hz）。読み取れない場合はNone
+    """
+    with open(audio_file_path, 'rb') as f:
+        header = f.read(WAV_HEADER_SIZE)
+    
+    if len(header) < WAV_HEADER_SIZE or header[0:4] != b'RIFF' or header[8:12] != b'WAVE' or header[12:16] != b'fmt ':
+        return None
+    
+    # fmtチャンクのオフセット24から4バイト（リトルエンディアン）がサンプルレート
+    return struct.unpack('<I', header[24:28])[0]
+
+
+def read_sample_rate_from_header(audio_file_path):
+    """
+    音声ファイルのヘッダーのみを読んでサンプルレートを取得する関数
+    
+    soundfile（WAV/FLAC/OGGなど）、mutagen（MP3/M4Aなど）、ffprobeの順に試す。
+    いずれも音声データ全体はデコードしないため、ファイルサイズによらず高速に動作する
+    
+    Parameters:
+        audio_file_path (str): 音声ファイルのパス
+        
+    Returns:
+        int: サンプルレート（Hz）。取得できない場合はNone
+    """
+    try:
+        import soundfile
+        return soundfile.info(audio_file_path).samplerate
+    except Exception:
+        pass
+    
+    try:
+        import mutagen
+        audio = mutagen.File(audio_file_path)
+        if audio is not None and getattr(audio.info, 'sample_rate', None):
+            return audio.info.sample_rate
+    except Exception:
+        pass
+    
+    try:
+        from pydub.utils import mediainfo
+        return int(mediainfo(audio_file_path)['sample_rate'])
+    except Exception:
+        pass
+    
+    return None
+
+
 def get_sample_rate(audio_file_path):
     """
     音声ファイルのサンプルレートを取得する関数
@@ -17,13 +166,22 @@ def get_sample_rate(audio_file_path):
         int: サンプルレート（Hz）
     """
     try:
-        # wavファイルの場合はwaveモジュールを使用
+        # wavファイルの場合はヘッダーから直接読み取り、読み取れない場合はwaveモジュールを使用
         if audio_file_path.lower().endswith('.wav'):
+            sample_rate = read_wav_sample_rate(audio_file_path)
+            if sample_rate:
+                return sample_rate
+            
             import wave
             with wave.open(audio_file_path, 'rb') as wf:
                 return wf.getframerate()
         
-        # その他の形式の場合はpydubを使用
+        # ヘッダーのみを読んで取得できる場合は、音声全体をデコードしない
+        sample_rate = read_sample_rate_from_header(audio_file_path)
+        if sample_rate:
+            return sample_rate
+        
+        # ヘッダーから取得できない場合はpydubで音声全体をデコードする
         try:
             from pydub import AudioSegment
             audio = AudioSegment.from_file(audio_file_path)
@@ -56,20 +214,104 @@ def detect_language(audio_file_path):
         str: 言語コード（"ja-JP"または"en-US"など）
     """
     # ファイル名やパスに日本語関連のキーワードが含まれているか確認
-    path_lower = audio_file_path.lower()
-    japanese_keywords = ['japan', 'japanese', 'jp', 'ja', '日本', '日本語']
-    
-    for keyword in japanese_keywords:
-        if keyword in path_lower:
-            return "ja-JP"
+    if JAPANESE_KEYWORDS_PATTERN.search(audio_file_path):
+        return "ja-JP"
     
     # デフォルトは日本語を返す（必要に応じて変更）
     # return "ja-JP"
     return "en-US"
 
 
+def group_words_by_speaker(words_info, speaker_words=None):
+    """
+    認識結果の単語を話者タグごとに振り分ける関数
+    
+    Parameters:
+        words_info (list): 認識結果の単語情報（alternatives[0].words）
+        speaker_words (defaultdict): 振り分け先（Noneの場合は新しく作成する）
+        
+    Returns:
+        defaultdict: 話者タグをキー、単語のリストを値とする辞書
+        
+    Raises:
+        ValueError: 単語に speaker_tag 属性がない場合
+    """
+    if speaker_words is None:
+        speaker_words = defaultdict(list)
+    
+    # 話者分離が有効な結果では全単語に speaker_tag があるため、確認は先頭の単語で1回だけ行う
+    if words_info and not hasattr(words_info[0], 'speaker_tag'):
+        raise ValueError("認識結果の単語に speaker_tag 属性がありません。話者分離が有効になっているか確認してください。")
+    
+    # C実装のattrgetterで話者タグと単語をまとめて取得する
+    get_tag_and_word = operator.attrgetter('speaker_tag', 'word')
+    
+    for word_info in words_info:
+        speaker_tag, word = get_tag_and_word(word_info)
+        speaker_words[speaker_tag].append(word)
+    
+    return speaker_words
+
+
+def get_cache_key(audio_file_path, min_speaker_count, max_speaker_count, language_code):
+    """
+    音声ファイルの内容と認識設定からキャッシュキーを生成する関数
+    
+    Parameters:
+        audio_file_path (str): 音声ファイルのパス
+        min_speaker_count (int): 想定される最小話者数
+        max_speaker_count (int): 想定される最大話者数
+        language_code (str): 言語コード（Noneの場合は自動検出）
+        
+    Returns:
+        str: キャッシュキー
+    """
+    return make_cache_key(file_digest(audio_file_path), {
+        "service": "google",
+        "min_speaker_count": min_speaker_count,
+        "max_speaker_count": max_speaker_count,
+        "language_code": language_code or detect_language(audio_file_path),
+    })
+
+
+def streaming_recognize_results(client, config, content, timeout=600):
+    """
+    音声データをストリーミング認識し、確定した認識結果のリストを返す関数
+    
+    音声データは小さなフレームに分けて送信し、確定した結果はその都度表示する
+    
+    Parameters:
+        client (speech.SpeechClient): Speech-to-Text APIクライアント
+        config (speech.RecognitionConfig): 音声認識の設定
+        content (bytes): 音声データ
+        timeout (int): 処理のタイムアウト時間（秒）
+        
+    Returns:
+        list: 確定した認識結果（StreamingRecognitionResult）のリスト
+    """
+    streaming_config = speech.StreamingRecognitionConfig(config=config)
+    
+    def request_generator():
+        view = memoryview(content)
+        for start in range(0, len(view), STREAMING_FRAME_SIZE):
+            yield speech.StreamingRecognizeRequest(audio_content=bytes(view[start:start + STREAMING_FRAME_SIZE]))
+    
+    final_results = []
+    responses = client.streaming_recognize(streaming_config, request_generator(), timeout=timeout)
+    for response in responses:
+        for result in response.results:
+            if not result.is_final:
+                continue
+            final_results.append(result)
+            if result.alternatives:
+                print(f"認識中: {result.alternatives[0].transcript}")
+    
+    return final_results
+
+
 def transcribe_file_with_speaker_diarization(
-    audio_file_path, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code=None
+    audio_file_path, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code=None, use_cache=True,
+    use_streaming=True
 ):
     """
     Google Cloud Speech-to-Text APIを使用して、オーディオファイルの文字起こしと話者分離を行う関数
@@ -80,6 +322,9 @@ def transcribe_file_with_speaker_diarization(
         max_speaker_count (int): 想定される最大話者数
         timeout (int): 処理のタイムアウト時間（秒）
         language_code (str): 言語コード（Noneの場合は自動検出）
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
+        use_streaming (bool): ストリーミング認識（streaming_recognize）を使用するかどうか
+            （Falseの場合は同期認識（recognize）を使用）
     
     Returns:
         dict: 話者ごとに分けられた文字起こし結果
@@ -92,20 +337,22 @@ def transcribe_file_with_speaker_diarization(
     if file_size > 10 * 1024 * 1024:  # 10MB
         print(f"ファイルサイズが大きいため（{file_size/1024/1024:.2f}MB）、GCSを使用して処理します")
         return transcribe_gcs_with_speaker_diarization(
-            audio_file_path, min_speaker_count, max_speaker_count, timeout=timeout, language_code=language_code
+            audio_file_path, min_speaker_count, max_speaker_count, timeout=timeout, language_code=language_code,
+            use_cache=use_cache
         )
     
+    # キャッシュの確認
+    if use_cache:
+        cache_key = get_cache_key(audio_file_path, min_speaker_count, max_speaker_count, language_code)
+        cached = load_cached_result(cache_key)
+        if cached is not None:
+            print(f"キャッシュから結果を読み込みました: {audio_file_path}")
+            return cached
+    
     # Google Cloud SDKの認証（環境変数 GOOGLE_APPLICATION_CREDENTIALS で設定するか、
     # explicit_credentials = service_account.Credentials.from_service_account_file('path/to/key.json')
     # client = speech.SpeechClient(credentials=explicit_credentials) として認証する）
-    client = speech.SpeechClient()
-    
-    # オーディオファイルの読み込み
-    with open(audio_file_path, "rb") as audio_file:
-        content = audio_file.read()
-    
-    # オーディオファイルの設定
-    audio = speech.RecognitionAudio(content=content)
+    client = get_speech_client()
     
     # 音声認識と話者分離の設定
     diarization_config = speech.SpeakerDiarizationConfig(
@@ -149,17 +396,29 @@ def transcribe_file_with_speaker_diarization(
     
     print(f"音声認識設定: エンコーディング={encoding}, サンプルレート={sample_rate}Hz, 言語={language_code}, 最小話者数={min_speaker_count}, 最大話者数={max_speaker_count}")
     
-    print("音声認識処理を開始します...")
-    response = client.recognize(config=config, audio=audio)
+    # オーディオファイルの読み込み
+    content = pathlib.Path(audio_file_path).read_bytes()
+    
+    if use_streaming:
+        # ストリーミング認識では、確定した結果から順に受け取る
+        print("音声認識処理を開始します（ストリーミング）...")
+        results = streaming_recognize_results(client, config, content, timeout=timeout)
+        del content
+    else:
+        # RecognitionAudioは内容をコピーして保持するため、読み込んだbytesはすぐに解放する
+        audio = speech.RecognitionAudio(content=content)
+        del content
+        print("音声認識処理を開始します...")
+        results = client.recognize(config=config, audio=audio, timeout=timeout).results
     
     # デバッグ情報：結果の数を表示
-    print(f"認識結果の数: {len(response.results)}")
-    if len(response.results) == 0:
+    print(f"認識結果の数: {len(results)}")
+    if len(results) == 0:
         print("警告: 認識結果がありません。音声ファイルを確認してください。")
         return {}
     
     # 最後の結果を使用（通常、話者分離情報を含む）
-    result = response.results[-1]
+    result = results[-1]
     
     if not result.alternatives:
         print("警告: 認識結果に代替案がありません。")
@@ -167,32 +426,19 @@ def transcribe_file_with_speaker_diarization(
     
     print(f"認識されたテキスト: {result.alternatives[0].transcript}")
     
-    if not hasattr(result.alternatives[0], 'words'):
+    # words は常に存在するフィールドのため、空かどうかで判定する
+    words_info = result.alternatives[0].words
+    if not words_info:
         print("警告: 認識結果に単語情報がありません。話者分離が有効になっていない可能性があります。")
         return {}
     
-    words_info = result.alternatives[0].words
     print(f"単語数: {len(words_info)}")
     
     # 話者ごとに分けて保存
-    speaker_transcripts = {}
-    
-    for word_info in words_info:
-        if not hasattr(word_info, 'speaker_tag'):
-            print(f"警告: 単語 '{word_info.word}' には speaker_tag 属性がありません")
-            continue
-            
-        speaker_tag = word_info.speaker_tag
-        word = word_info.word
-        
-        if speaker_tag not in speaker_transcripts:
-            speaker_transcripts[speaker_tag] = []
-        
-        speaker_transcripts[speaker_tag].append(word)
+    speaker_words = group_words_by_speaker(words_info)
     
     # 話者ごとのテキストを結合
-    for speaker, words in speaker_transcripts.items():
-        speaker_transcripts[speaker] = " ".join(words)
+    speaker_transcripts = {speaker: " ".join(words) for speaker, words in speaker_words.items()}
     
     # 結果の要約を表示
     print(f"\n話者の数: {len(speaker_transcripts)}")
@@ -200,11 +446,54 @@ def transcribe_file_with_speaker_diarization(
         word_count = len(transcript.split())
         print(f"話者 {speaker}: {word_count}単語")
     
+    if use_cache and speaker_transcripts:
+        save_cached_result(cache_key, speaker_transcripts)
+    
     return speaker_transcripts
 
 
+def delete_gcs_blob(blob):
+    """
+    GCS上のファイルを削除する関数（cleanup_executorからバックグラウンドで実行される）
+    
+    Parameters:
+        blob (google.cloud.storage.Blob): 削除するBlob
+    """
+    gcs_uri = f"gs://{blob.bucket.name}/{blob.name}"
+    try:
+        blob.delete()
+        print(f"GCSからファイルを削除しました: {gcs_uri}")
+    except Exception as e:
+        print(f"GCSからのファイル削除に失敗しました: {e}")
+
+
+def upload_to_gcs(blob, audio_file_path):
+    """
+    音声ファイルをGCSにアップロードする関数
+    
+    チャンクサイズより大きいファイルは、複数のパートに分けて並列にアップロードする
+    
+    Parameters:
+        blob (google.cloud.storage.Blob): アップロード先のBlob
+        audio_file_path (str): アップロードする音声ファイルのパス
+    """
+    if transfer_manager is None or os.path.getsize(audio_file_path) <= UPLOAD_CHUNK_SIZE:
+        blob.chunk_size = UPLOAD_CHUNK_SIZE
+        blob.upload_from_filename(audio_file_path)
+        return
+    
+    transfer_manager.upload_chunks_concurrently(
+        audio_file_path,
+        blob,
+        chunk_size=UPLOAD_CHUNK_SIZE,
+        max_workers=UPLOAD_MAX_WORKERS,
+        worker_type=transfer_manager.THREAD,
+    )
+
+
 def transcribe_gcs_with_speaker_diarization(
-    audio_file_path, min_speaker_count=2, max_speaker_count=6, bucket_name=None, timeout=600, language_code=None
+    audio_file_path, min_speaker_count=2, max_speaker_count=6, bucket_name=None, timeout=600, language_code=None,
+    use_cache=True
 ):
     """
     Google Cloud Storageを使用して大きな音声ファイルの文字起こしと話者分離を行う関数
@@ -216,10 +505,19 @@ def transcribe_gcs_with_speaker_diarization(
         bucket_name (str): 使用するGCSバケット名（Noneの場合は環境変数から取得）
         timeout (int): 処理のタイムアウト時間（秒）
         language_code (str): 言語コード（Noneの場合は自動検出）
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
     
     Returns:
         dict: 話者ごとに分けられた文字起こし結果
     """
+    # キャッシュの確認
+    if use_cache:
+        cache_key = get_cache_key(audio_file_path, min_speaker_count, max_speaker_count, language_code)
+        cached = load_cached_result(cache_key)
+        if cached is not None:
+            print(f"キャッシュから結果を読み込みました: {audio_file_path}")
+            return cached
+    
     # バケット名の取得
     if bucket_name is None:
         bucket_name = os.environ.get("GCS_BUCKET_NAME")
@@ -227,30 +525,37 @@ def transcribe_gcs_with_speaker_diarization(
             raise ValueError("GCS_BUCKET_NAME環境変数が設定されていません。バケット名を指定してください。")
     
     # ファイル名の取得
+    # 複数ファイルを並行処理しても衝突しないよう、一意なプレフィックスを付ける
     file_name = os.path.basename(audio_file_path)
-    gcs_object_name = f"audio_files/{file_name}"
-    
-    # GCSクライアントの初期化
-    storage_client = storage.Client()
-    
-    # バケットの取得（バケットが存在しない場合はエラーメッセージを表示）
-    try:
-        bucket = storage_client.get_bucket(bucket_name)
-    except Exception as e:
-        raise ValueError(f"バケット '{bucket_name}' へのアクセスに失敗しました: {e}\n"
-                         f"1. バケットが存在することを確認してください\n"
-                         f"2. サービスアカウントに適切な権限があることを確認してください\n"
-                         f"   - Storage オブジェクト管理者 (roles/storage.objectAdmin)\n"
-                         f"   - Storage バケット閲覧者 (roles/storage.buckets.get)")
-    
-    # ファイルのアップロード
-    blob = bucket.blob(gcs_object_name)
-    blob.upload_from_filename(audio_file_path)
-    
-    print(f"ファイルをGCSにアップロードしました: gs://{bucket_name}/{gcs_object_name}")
+    gcs_object_name = f"audio_files/{uuid.uuid4()}_{file_name}"
     
-    # Speech-to-Text APIクライアントの初期化
-    client = speech.SpeechClient()
+    # アップロードの完了を待たずに、Speech-to-Text APIクライアントの初期化と
+    # サンプルレートの取得をバックグラウンドで進めておく
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        client_future = executor.submit(get_speech_client)
+        sample_rate_future = executor.submit(get_sample_rate, audio_file_path)
+        
+        # GCSクライアントの取得
+        storage_client = get_storage_client()
+        
+        # バケットの取得（バケットが存在しない場合はエラーメッセージを表示）
+        try:
+            bucket = storage_client.get_bucket(bucket_name)
+        except Exception as e:
+            raise ValueError(f"バケット '{bucket_name}' へのアクセスに失敗しました: {e}\n"
+                             f"1. バケットが存在することを確認してください\n"
+                             f"2. サービスアカウントに適切な権限があることを確認してください\n"
+                             f"   - Storage オブジェクト管理者 (roles/storage.objectAdmin)\n"
+                             f"   - Storage バケット閲覧者 (roles/storage.buckets.get)")
+        
+        # ファイルのアップロード
+        blob = bucket.blob(gcs_object_name)
+        upload_to_gcs(blob, audio_file_path)
+        
+        print(f"ファイルをGCSにアップロードしました: gs://{bucket_name}/{gcs_object_name}")
+        
+        client = client_future.result()
+        sample_rate = sample_rate_future.result()
     
     # GCS上のオーディオファイルを指定
     audio = speech.RecognitionAudio(uri=f"gs://{bucket_name}/{gcs_object_name}")
@@ -277,9 +582,6 @@ def transcribe_gcs_with_speaker_diarization(
         encoding = speech.RecognitionConfig.AudioEncoding.LINEAR16
         print(f"警告: 未知のファイル形式 '{file_extension}'。LINEAR16エンコーディングを使用します。")
     
-    # サンプルレートを取得
-    sample_rate = get_sample_rate(audio_file_path)
-    
     # 言語設定
     if language_code is None:
         language_code = detect_language(audio_file_path)
@@ -301,9 +603,9 @@ def transcribe_gcs_with_speaker_diarization(
     print("音声認識処理を開始します（GCS経由）...")
     operation = client.long_running_recognize(config=config, audio=audio)
     
-    import time
     print(f"処理中... タイムアウト: {timeout}秒")
     start_time = time.time()
+    next_report_time = PROGRESS_REPORT_INTERVAL
     
     # 進捗状況を定期的に表示
     while not operation.done():
@@ -312,49 +614,42 @@ def transcribe_gcs_with_speaker_diarization(
             raise TimeoutError(f"処理がタイムアウトしました（{timeout}秒）。より長いタイムアウト時間を指定してください。")
         
         # 1分ごとに進捗状況を表示
-        if int(elapsed_time) % 60 == 0 and int(elapsed_time) > 0:
+        if elapsed_time >= next_report_time:
             print(f"処理中... 経過時間: {int(elapsed_time)}秒")
+            next_report_time += PROGRESS_REPORT_INTERVAL
         
         time.sleep(10)  # 10秒ごとに確認
     
     print(f"処理が完了しました。所要時間: {int(time.time() - start_time)}秒")
     response = operation.result()
     
+    # GCSからファイルを削除（オプション）。結果の解析と並行してバックグラウンドで行う
+    cleanup_executor.submit(delete_gcs_blob, blob)
+    
     # デバッグ情報：結果の数を表示
     print(f"認識結果の数: {len(response.results)}")
     
     # 結果の解析と話者ごとの整理
-    speaker_transcripts = {}
+    speaker_words = defaultdict(list)
     
     for i, result in enumerate(response.results):
         if not result.alternatives:
             continue
             
-        print(f"結果 {i+1}: {result.alternatives[0].transcript}")
-            
-        if not hasattr(result.alternatives[0], 'words'):
-            print(f"警告: 結果 {i+1} には words 属性がありません")
-            continue
-            
+        # 結果ごとの詳細はデバッグログに出力する（ログレベルが高い場合は文字列を組み立てない）
+        logger.debug("結果 %d: %s", i + 1, result.alternatives[0].transcript)
+        
         words_info = result.alternatives[0].words
-        print(f"  単語数: {len(words_info)}")
+        if not words_info:
+            logger.debug("結果 %d には単語情報がありません", i + 1)
+            continue
         
-        for word_info in words_info:
-            if not hasattr(word_info, 'speaker_tag'):
-                print(f"警告: 単語 '{word_info.word}' には speaker_tag 属性がありません")
-                continue
-                
-            speaker_tag = word_info.speaker_tag
-            word = word_info.word
-            
-            if speaker_tag not in speaker_transcripts:
-                speaker_transcripts[speaker_tag] = []
-            
-            speaker_transcripts[speaker_tag].append(word)
+        logger.debug("  単語数: %d", len(words_info))
+        
+        group_words_by_speaker(words_info, speaker_words)
     
     # 話者ごとのテキストを結合
-    for speaker, words in speaker_transcripts.items():
-        speaker_transcripts[speaker] = " ".join(words)
+    speaker_transcripts = {speaker: " ".join(words) for speaker, words in speaker_words.items()}
     
     # 結果の要約を表示
     print(f"\n話者の数: {len(speaker_transcripts)}")
@@ -362,16 +657,349 @@ def transcribe_gcs_with_speaker_diarization(
         word_count = len(transcript.split())
         print(f"話者 {speaker}: {word_count}単語")
     
-    # GCSからファイルを削除（オプション）
+    if use_cache and speaker_transcripts:
+        save_cached_result(cache_key, speaker_transcripts)
+    
+    return speaker_transcripts
+
+
+def split_audio(audio_file_path, output_dir, chunk_sec=DEFAULT_CHUNK_SEC, overlap_sec=DEFAULT_OVERLAP_SEC):
+    """
+    長い音声ファイルを、前後が重なり合う複数のチャンクに分割する関数
+    
+    各チャンクは認識に適したモノラル16kHzのFLACとして書き出す
+    
+    Parameters:
+        audio_file_path (str): 分割する音声ファイルのパス
+        output_dir (str): チャンクの書き出し先ディレクトリ
+        chunk_sec (int): チャンクの長さ（秒）
+        overlap_sec (int): 隣り合うチャンクの重なりの長さ（秒）
+        
+    Returns:
+        list: (チャンクの開始時刻（秒）, チャンクファイルのパス) のリスト
+    """
+    if overlap_sec >= chunk_sec:
+        raise ValueError(f"overlap_sec（{overlap_sec}秒）は chunk_sec（{chunk_sec}秒）より短くしてください。")
+    
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(audio_file_path)
+    audio = audio.set_channels(1).set_frame_rate(CHUNK_SAMPLE_RATE)
+    
+    chunk_ms = int(chunk_sec * 1000)
+    step_ms = int((chunk_sec - overlap_sec) * 1000)
+    file_name_without_ext = os.path.splitext(os.path.basename(audio_file_path))[0]
+    
+    chunks = []
+    for i, start_ms in enumerate(range(0, len(audio), step_ms)):
+        chunk_path = os.path.join(output_dir, f"{file_name_without_ext}_{i:04d}.flac")
+        audio[start_ms:start_ms + chunk_ms].export(chunk_path, format="flac")
+        chunks.append((start_ms / 1000, chunk_path))
+        
+        # 最後のチャンクが音声の末尾まで含んでいれば終了
+        if start_ms + chunk_ms >= len(audio):
+            break
+    
+    return chunks
+
+
+def recognize_chunk_words(
+    chunk_path, offset_sec, bucket, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code="ja-JP"
+):
+    """
+    split_audioで作成したチャンク1つを認識し、時刻付きの単語リストを返す関数
+    
+    インラインで送信できる音声は約1分までのため、チャンクはGCSにアップロードしてから認識する。
+    アップロードしたファイルは認識後にバックグラウンドで削除する
+    
+    Parameters:
+        chunk_path (str): チャンクファイルのパス
+        offset_sec (float): 元の音声におけるチャンクの開始時刻（秒）
+        bucket (google.cloud.storage.Bucket): チャンクのアップロード先のGCSバケット
+        min_speaker_count (int): 想定される最小話者数
+        max_speaker_count (int): 想定される最大話者数
+        timeout (int): 処理のタイムアウト時間（秒）
+        language_code (str): 言語コード
+        
+    Returns:
+        list: (開始時刻, 終了時刻, 話者タグ, 単語) のリスト（時刻は元の音声基準の秒）
+    """
+    client = get_speech_client()
+    
+    # チャンクのアップロード（並行処理しても衝突しないよう、一意なプレフィックスを付ける）
+    gcs_object_name = f"audio_files/{uuid.uuid4()}_{os.path.basename(chunk_path)}"
+    blob = bucket.blob(gcs_object_name)
+    upload_to_gcs(blob, chunk_path)
+    audio = speech.RecognitionAudio(uri=f"gs://{bucket.name}/{gcs_object_name}")
+    
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.FLAC,
+        sample_rate_hertz=CHUNK_SAMPLE_RATE,
+        language_code=language_code,
+        enable_automatic_punctuation=True,
+        enable_word_time_offsets=True,
+        diarization_config=speech.SpeakerDiarizationConfig(
+            enable_speaker_diarization=True,
+            min_speaker_count=min_speaker_count,
+            max_speaker_count=max_speaker_count,
+        ),
+        model="latest_long",  # 長時間音声向けモデル
+    )
+    
     try:
-        blob.delete()
-        print(f"GCSからファイルを削除しました: gs://{bucket_name}/{gcs_object_name}")
-    except Exception as e:
-        print(f"GCSからのファイル削除に失敗しました: {e}")
+        operation = client.long_running_recognize(config=config, audio=audio)
+        response = operation.result(timeout=timeout)
+    finally:
+        # 認識に失敗した場合もGCS上のチャンクを残さない
+        cleanup_executor.submit(delete_gcs_blob, blob)
+    
+    # 最後の結果に、話者タグ付きの全単語が含まれる
+    if not response.results or not response.results[-1].alternatives:
+        return []
+    
+    return [
+        (
+            offset_sec + word_info.start_time.total_seconds(),
+            offset_sec + word_info.end_time.total_seconds(),
+            word_info.speaker_tag,
+            word_info.word,
+        )
+        for word_info in response.results[-1].alternatives[0].words
+    ]
+
+
+def match_chunk_speakers(previous_words, current_words, overlap_start, overlap_end):
+    """
+    重なり区間の単語をもとに、チャンクの話者タグを直前のチャンクの話者タグに対応付ける関数
+    
+    重なり区間内で発話時間が重なる話者の組ほどスコアが高くなり、
+    スコアの高い組から順に1対1で割り当てる
+    
+    Parameters:
+        previous_words (list): 直前のチャンクの単語リスト（話者タグは統合後のもの）
+        current_words (list): 現在のチャンクの単語リスト（話者タグはチャンク内のもの）
+        overlap_start (float): 重なり区間の開始時刻（秒）
+        overlap_end (float): 重なり区間の終了時刻（秒）
+        
+    Returns:
+        dict: 現在のチャンクの話者タグ → 直前のチャンクの話者タグ
+    """
+    def in_overlap(words):
+        return [w for w in words if w[0] < overlap_end and w[1] > overlap_start]
+    
+    scores = defaultdict(float)
+    for prev_start, prev_end, prev_tag, _ in in_overlap(previous_words):
+        for cur_start, cur_end, cur_tag, _ in in_overlap(current_words):
+            shared = min(prev_end, cur_end) - max(prev_start, cur_start)
+            if shared > 0:
+                scores[(cur_tag, prev_tag)] += shared
+    
+    mapping = {}
+    used_prev_tags = set()
+    for (cur_tag, prev_tag), _ in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+        if cur_tag not in mapping and prev_tag not in used_prev_tags:
+            mapping[cur_tag] = prev_tag
+            used_prev_tags.add(prev_tag)
+    
+    return mapping
+
+
+def merge_chunk_words(chunk_results, overlap_sec=DEFAULT_OVERLAP_SEC):
+    """
+    チャンクごとの認識結果を統合し、話者ごとの文字起こし結果にまとめる関数
+    
+    重なり区間は中央で切り分けて単語の重複を除き、話者タグはmatch_chunk_speakersで
+    チャンク間の対応を取る。対応の取れなかった話者には新しい話者タグを割り当てる
+    
+    Parameters:
+        chunk_results (list): (チャンクの開始時刻, 単語リスト) のリスト（開始時刻順）
+        overlap_sec (int): 隣り合うチャンクの重なりの長さ（秒）
+        
+    Returns:
+        dict: 話者ごとに分けられた文字起こし結果
+    """
+    merged_words = []
+    previous_words = []
+    next_speaker_tag = 1
+    
+    for i, (offset_sec, words) in enumerate(chunk_results):
+        if i == 0:
+            mapping = {}
+        else:
+            mapping = match_chunk_speakers(previous_words, words, offset_sec, offset_sec + overlap_sec)
+        
+        # 対応の取れなかった話者に新しいタグを割り当てる
+        for tag in sorted({w[2] for w in words}):
+            if tag not in mapping:
+                mapping[tag] = next_speaker_tag
+                next_speaker_tag += 1
+        
+        words = [(start, end, mapping[tag], word) for start, end, tag, word in words]
+        
+        # 重なり区間の中央より前は直前のチャンク、以降はこのチャンクの単語を採用する
+        lower = offset_sec + overlap_sec / 2 if i > 0 else float("-inf")
+        upper = chunk_results[i + 1][0] + overlap_sec / 2 if i + 1 < len(chunk_results) else float("inf")
+        merged_words.extend(w for w in words if lower <= w[0] < upper)
+        
+        previous_words = words
+    
+    speaker_words = defaultdict(list)
+    for _, _, speaker_tag, word in sorted(merged_words, key=lambda w: w[0]):
+        speaker_words[speaker_tag].append(word)
+    
+    return {speaker: " ".join(words) for speaker, words in speaker_words.items()}
+
+
+def transcribe_long_file_with_speaker_diarization(
+    audio_file_path, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code=None,
+    chunk_sec=DEFAULT_CHUNK_SEC, overlap_sec=DEFAULT_OVERLAP_SEC, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    bucket_name=None
+):
+    """
+    長い音声ファイルをチャンクに分割して並行して認識し、話者分離結果を統合する関数
+    
+    1つの長いジョブを待つ代わりに複数の短いジョブを同時に実行するため、
+    数分以上の音声では処理時間が大幅に短くなる
+    
+    Parameters:
+        audio_file_path (str): 処理するオーディオファイルのパス
+        min_speaker_count (int): 想定される最小話者数
+        max_speaker_count (int): 想定される最大話者数
+        timeout (int): 各チャンクの処理のタイムアウト時間（秒）
+        language_code (str): 言語コード（Noneの場合は自動検出）
+        chunk_sec (int): チャンクの長さ（秒）
+        overlap_sec (int): 隣り合うチャンクの重なりの長さ（秒）
+        max_concurrency (int): 同時に認識するチャンク数の上限
+        bucket_name (str): チャンクのアップロードに使用するGCSバケット名（Noneの場合は環境変数から取得）
+    
+    Returns:
+        dict: 話者ごとに分けられた文字起こし結果
+    """
+    # バケット名の取得
+    if bucket_name is None:
+        bucket_name = os.environ.get("GCS_BUCKET_NAME")
+        if not bucket_name:
+            raise ValueError("GCS_BUCKET_NAME環境変数が設定されていません。バケット名を指定してください。")
+    bucket = get_storage_client().bucket(bucket_name)
+    
+    if language_code is None:
+        language_code = detect_language(audio_file_path)
+    
+    print(f"言語設定: {language_code}")
+    
+    async def recognize_all(chunks):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(offset_sec, chunk_path):
+            async with semaphore:
+                words = await loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        recognize_chunk_words,
+                        chunk_path,
+                        offset_sec,
+                        bucket,
+                        min_speaker_count=min_speaker_count,
+                        max_speaker_count=max_speaker_count,
+                        timeout=timeout,
+                        language_code=language_code,
+                    ),
+                )
+                return offset_sec, words
+        
+        return await asyncio.gather(*[run(offset_sec, path) for offset_sec, path in chunks])
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunks = split_audio(audio_file_path, tmp_dir, chunk_sec=chunk_sec, overlap_sec=overlap_sec)
+        print(f"音声を{len(chunks)}個のチャンクに分割しました（{chunk_sec}秒ごと、重なり{overlap_sec}秒）")
+        
+        print("音声認識処理を開始します（チャンク並行処理）...")
+        chunk_results = asyncio.run(recognize_all(chunks))
+    
+    speaker_transcripts = merge_chunk_words(chunk_results, overlap_sec=overlap_sec)
+    
+    # 結果の要約を表示
+    print(f"\n話者の数: {len(speaker_transcripts)}")
+    for speaker, transcript in speaker_transcripts.items():
+        word_count = len(transcript.split())
+        print(f"話者 {speaker}: {word_count}単語")
     
     return speaker_transcripts
 
 
+async def transcribe_many_async(
+    audio_file_paths, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code=None,
+    max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=True
+):
+    """
+    複数のオーディオファイルの文字起こしと話者分離を並行して行う関数（非同期版）
+    
+    各ファイルの処理はスレッドプール上で実行されるため、イベントループはブロックされない
+    
+    Parameters:
+        audio_file_paths (list): 処理するオーディオファイルのパスのリスト
+        min_speaker_count (int): 想定される最小話者数
+        max_speaker_count (int): 想定される最大話者数
+        timeout (int): 各ファイルの処理のタイムアウト時間（秒）
+        language_code (str): 言語コード（Noneの場合はファイルごとに自動検出）
+        max_concurrency (int): 同時に処理するファイル数の上限
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
+    
+    Returns:
+        list: 入力と同じ順序で並んだ、ファイルごとの文字起こし結果（dict）。処理に失敗したファイルの位置には発生した例外が入る
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(audio_file_path):
+        async with semaphore:
+            return await loop.run_in_executor(
+                None,
+                functools.partial(
+                    transcribe_file_with_speaker_diarization,
+                    audio_file_path,
+                    min_speaker_count=min_speaker_count,
+                    max_speaker_count=max_speaker_count,
+                    timeout=timeout,
+                    language_code=language_code,
+                    use_cache=use_cache,
+                ),
+            )
+    
+    # 一部のファイルが失敗しても、他のファイルの結果は返す
+    return await asyncio.gather(*[run(path) for path in audio_file_paths], return_exceptions=True)
+
+
+def transcribe_many(
+    audio_file_paths, min_speaker_count=2, max_speaker_count=6, timeout=600, language_code=None,
+    max_concurrency=DEFAULT_MAX_CONCURRENCY, use_cache=True
+):
+    """
+    複数のオーディオファイルの文字起こしと話者分離を並行して行う関数
+    
+    Parameters:
+        audio_file_paths (list): 処理するオーディオファイルのパスのリスト
+        min_speaker_count (int): 想定される最小話者数
+        max_speaker_count (int): 想定される最大話者数
+        timeout (int): 各ファイルの処理のタイムアウト時間（秒）
+        language_code (str): 言語コード（Noneの場合はファイルごとに自動検出）
+        max_concurrency (int): 同時に処理するファイル数の上限
+        use_cache (bool): 同じ音声・設定の結果をキャッシュから再利用するかどうか
+    
+    Returns:
+        list: 入力と同じ順序で並んだ、ファイルごとの文字起こし結果（dict）。処理に失敗したファイルの位置には発生した例外が入る
+    """
+    return asyncio.run(transcribe_many_async(
+        audio_file_paths,
+        min_speaker_count=min_speaker_count,
+        max_speaker_count=max_speaker_count,
+        timeout=timeout,
+        language_code=language_code,
+        max_concurrency=max_concurrency,
+        use_cache=use_cache,
+    ))
+
+
 def main():
     # 使用例
     audio_file_path = "/Users/fumipen/Documents/progress/program/progress/01_test_folder/20250305_progos.mp3"
@@ -445,8 +1073,13 @@ def save_results_to_file(speaker_transcripts, audio_file_path, output_format="tx
     if output_format.lower() == "json":
         # JSON形式で保存
         output_file = os.path.join(output_dir, f"{file_name_without_ext}_{timestamp}_results.json")
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(speaker_transcripts, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            # orjsonはUTF-8のbytesを直接出力する（話者タグが整数のためOPT_NON_STR_KEYSを指定）
+            with open(output_file, "wb") as f:
+                f.write(orjson.dumps(speaker_transcripts, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(speaker_transcripts, f, ensure_ascii=False, indent=2)
     else:
         # テキスト形式で保存
         output_file = os.path.join(output_dir, f"{file_name_without_ext}_{timestamp}_results.txt")
@@ -3,31 +3,31 @@
 
 import sys
 import os
-import boto3
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from amazon_speaker_diarization import transcribe_with_speaker_diarization
+from amazon_speaker_diarization import transcribe_many, upload_audio_to_s3
 
 def main():
     # S3バケットとファイル名の設定
     bucket_name = "your-bucket-name"  # 自分のバケット名に変更
-    file_name = "conversation.mp3"    # 自分のファイル名に変更
-    local_file_path = "../sample_data/conversation.mp3"  # ローカルファイルパス
+    # ローカルファイルパスとS3上のファイル名の組（複数指定すると並行して処理されます）
+    files = [
+        ("../sample_data/conversation.mp3", "conversation.mp3"),  # 自分のファイルに変更
+    ]
     
     # S3にファイルをアップロード
     try:
         print(f"S3 ({bucket_name})にファイルをアップロード中...")
-        s3 = boto3.client('s3')
-        s3.upload_file(local_file_path, bucket_name, file_name)
+        audio_uris = [
+            upload_audio_to_s3(local_file_path, bucket_name, file_name)
+            for local_file_path, file_name in files
+        ]
         print("アップロード完了")
         
-        # S3のファイルURIを構築
-        audio_uri = f"s3://{bucket_name}/{file_name}"
-        
-        # 話者分離を実行
+        # 話者分離を実行（複数ファイルは並行して処理）
         print("Amazon Transcribeによる話者分離を開始...")
-        speaker_transcripts = transcribe_with_speaker_diarization(
-            audio_uri,
+        results = transcribe_many(
+            audio_uris,
             language_code='ja-JP',
             max_speakers=4  # 想定される最大話者数に調整
         )
@@ -35,16 +35,28 @@ def main():
         # 結果の表示と保存
         print("\n=== 話者分離結果 ===")
         with open("amazon_results.txt", "w", encoding="utf-8") as f:
-            for speaker, transcript in speaker_transcripts.items():
-                output = f"{speaker}: {transcript}"
-                print(output)
-                f.write(output + "\n")
+            for audio_uri, speaker_transcripts in zip(audio_uris, results):
+                header = f"--- {audio_uri} ---"
+                print(header)
+                f.write(header + "\n")
+                if isinstance(speaker_transcripts, Exception):
+                    output = f"処理に失敗しました: {speaker_transcripts}"
+                    print(output)
+                    f.write(output + "\n")
+                    continue
+                for speaker, transcript in speaker_transcripts.items():
+                    output = f"{speaker}: {transcript}"
+                    print(output)
+                    f.write(output + "\n")
         
         print("\n結果はamazon_results.txtに保存されました")
         
         # オプション: 処理が終わったS3のファイルを削除
-        # s3.delete_object(Bucket=bucket_name, Key=file_name)
-        # print(f"S3のファイル {file_name} を削除しました")
+        # import boto3
+        # s3 = boto3.client('s3')
+        # for _, file_name in files:
+        #     s3.delete_object(Bucket=bucket_name, Key=file_name)
+        #     print(f"S3のファイル {file_name} を削除しました")
         
     except Exception as e:
         print(f"エラーが発生しました: {e}")
@@ -5,17 +5,19 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from google_speaker_diarization import transcribe_file_with_speaker_diarization
+from google_speaker_diarization import transcribe_many
 
 def main():
-    # オーディオファイルパスを指定
-    audio_file_path = "../sample_data/conversation.wav"  # 自分のファイルパスに変更してください
+    # オーディオファイルパスを指定（複数指定すると並行して処理されます）
+    audio_file_paths = [
+        "../sample_data/conversation.wav",  # 自分のファイルパスに変更してください
+    ]
     
     # 話者分離を実行
     try:
         print("Google Cloud Speech-to-Textによる話者分離を開始...")
-        speaker_transcripts = transcribe_file_with_speaker_diarization(
-            audio_file_path,
+        results = transcribe_many(
+            audio_file_paths,
             min_speaker_count=2,
             max_speaker_count=4  # 想定される最大話者数に調整
         )
@@ -23,10 +25,19 @@ def main():
         # 結果の表示と保存
         print("\n=== 話者分離結果 ===")
         with open("google_results.txt", "w", encoding="utf-8") as f:
-            for speaker, transcript in speaker_transcripts.items():
-                output = f"話者 {speaker}: {transcript}"
-                print(output)
-                f.write(output + "\n")
+            for audio_file_path, speaker_transcripts in zip(audio_file_paths, results):
+                header = f"--- {audio_file_path} ---"
+                print(header)
+                f.write(header + "\n")
+                if isinstance(speaker_transcripts, Exception):
+                    output = f"処理に失敗しました: {speaker_transcripts}"
+                    print(output)
+                    f.write(output + "\n")
+                    continue
+                for speaker, transcript in speaker_transcripts.items():
+                    output = f"話者 {speaker}: {transcript}"
+                    print(output)
+                    f.write(output + "\n")
         
         print("\n結果はgoogle_results.txtに保存されました")
         
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import tempfile
+from dotenv import load_dotenv
+
+# .envファイルから環境変数を読み込む
+load_dotenv()
+
+# キャッシュの保存先（環境変数 SPEAKER_SEP_CACHE_DIR で変更可能）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".speaker_sep_cache")
+
+
+def get_cache_dir():
+    """
+    キャッシュの保存先ディレクトリを取得する関数
+
+    Returns:
+        str: キャッシュディレクトリのパス
+    """
+    return os.environ.get("SPEAKER_SEP_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def file_digest(file_path):
+    """
+    ファイル内容のSHA-256ハッシュを計算する関数
+
+    Parameters:
+        file_path (str): ハッシュを計算するファイルのパス
+
+    Returns:
+        str: 16進数表記のハッシュ値
+    """
+    with open(file_path, "rb") as f:
+        # Python 3.11以降はC実装のfile_digestを使用
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+def make_cache_key(source_id, config):
+    """
+    音声の識別子と処理設定からキャッシュキーを生成する関数
+
+    Parameters:
+        source_id (str): 音声を一意に識別する文字列（ファイル内容のハッシュなど）
+        config (dict): 結果に影響する処理設定
+
+    Returns:
+        str: キャッシュキー
+    """
+    h = hashlib.sha256(source_id.encode("utf-8"))
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_cached_result(cache_key):
+    """
+    キャッシュから話者分離結果を読み込む関数
+
+    Parameters:
+        cache_key (str): キャッシュキー
+
+    Returns:
+        dict: キャッシュされた話者ごとの文字起こし結果（存在しない場合はNone）
+    """
+    cache_file = os.path.join(get_cache_dir(), f"{cache_key}.json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            # 話者キーの型（Googleは整数、Amazonは文字列）を保つため、ペアのリストで保存している
+            return {speaker: transcript for speaker, transcript in json.load(f)}
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_result(cache_key, speaker_transcripts):
+    """
+    話者分離結果をキャッシュに保存する関数
+
+    Parameters:
+        cache_key (str): キャッシュキー
+        speaker_transcripts (dict): 話者ごとの文字起こし結果
+    """
+    cache_dir = get_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 並行実行時に書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(list(speaker_transcripts.items()), f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(cache_dir, f"{cache_key}.json"))
+    except OSError as e:
+        print(f"キャッシュの保存に失敗しました: {e}")